@@ -12,19 +12,27 @@ TELEGRAM_API_HASH = os.getenv('TELEGRAM_API_HASH', '')
 DATABASE_PATH = "telegram_downloader.db"
 
 # Download Configuration
-DOWNLOAD_DIR = Path("downloads")
-SESSION_DIR = Path("sessions")
-TEMP_DIR = Path("temp")
+BASE_DIR = Path(__file__).resolve().parent
+DOWNLOAD_DIR = BASE_DIR / "downloads"
+SESSION_DIR = BASE_DIR / "sessions"
+TEMP_DIR = BASE_DIR / "temp"
 
 # Supported file extensions
-SUPPORTED_EXTENSIONS = {
+SUPPORTED_EXTENSIONS = frozenset({
     '.pdf', '.epub', '.mobi', '.azw3', '.djvu', '.fb2', 
     '.txt', '.doc', '.docx', '.rtf', '.lit', '.pdb'
-}
+})
+
+def file_extension(filename: str) -> str:
+    """Return the lower-cased extension of a filename, including the dot"""
+    # rfind + slice avoids building a Path per scanned message
+    i = filename.rfind('.')
+    return filename[i:].lower() if i >= 0 else ''
 
 # Download limits
 DEFAULT_MAX_CONCURRENT_DOWNLOADS = 3
 DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1MB chunks
+DOWNLOAD_PART_SIZE_KB = 512  # Largest part Telegram serves per request
 DEFAULT_TIMEOUT = 30  # seconds
 
 # WebSocket Configuration
@@ -40,7 +48,7 @@ HOST = os.getenv('HOST', '0.0.0.0')
 PORT = int(os.getenv('PORT', '3000'))
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
-# Ensure directories exist
-DOWNLOAD_DIR.mkdir(exist_ok=True)
-SESSION_DIR.mkdir(exist_ok=True)
-TEMP_DIR.mkdir(exist_ok=True)
\ No newline at end of file
+def ensure_dirs():
+    """Create the download, session and temp directories (call once at startup)"""
+    for directory in (DOWNLOAD_DIR, SESSION_DIR, TEMP_DIR):
+        directory.mkdir(exist_ok=True)
\ No newline at end of file
@@ -1,10 +1,12 @@
 """
 Database manager for SQLite operations
 """
+import asyncio
+import sqlite3
 import aiosqlite
 import json
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 from models import DownloadInfo, FileInfo, DownloadStatus, FileStatus, TelegramSession
 import logging
 
@@ -12,9 +14,131 @@ logger = logging.getLogger(__name__)
 
 DATABASE_PATH = "telegram_downloader.db"
 
+# INSERT ... RETURNING needs SQLite 3.35
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+# Number of read-only connections served alongside the single writer
+READ_POOL_SIZE = 4
+
+# Seconds between flushes of coalesced download/file updates
+FLUSH_INTERVAL = 0.25
+
+# Inserted file rows after which planner statistics are refreshed
+ANALYZE_THRESHOLD = 1000
+
+# Rows per multi-row INSERT, keeping 7 parameters a row under SQLite's limit
+BULK_INSERT_ROWS = 500
+
+# Status value -> enum member, avoiding Enum.__call__ per materialized row
+_DS_LOOKUP = {status.value: status for status in DownloadStatus}
+_FS_LOOKUP = {status.value: status for status in FileStatus}
+
+# Explicit column lists read positionally by _row_to_download_info and
+# _row_to_file_info; rows are plain tuples rather than aiosqlite.Row
+_DOWNLOAD_COLS = (
+    "id, channel_name, channel_id, status, total_files, completed_files, "
+    "failed_files, skipped_files, total_size, downloaded_size, progress, "
+    "file_types, max_files, created_at, updated_at, completed_at, error_message"
+)
+_DOWNLOAD_COLUMN_NAMES = frozenset(col.strip() for col in _DOWNLOAD_COLS.split(","))
+_FILE_COLS = (
+    "id, download_id, message_id, filename, file_type, file_size, file_hash, "
+    "download_path, status, progress, bytes_downloaded, created_at, updated_at, "
+    "error_message"
+)
+
+# Per-connection tuning; journal_mode=WAL is persisted in the database file
+# and is set once in init_database()
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA analysis_limit=1000",
+)
+
+async def _apply_pragmas(db: aiosqlite.Connection):
+    """Apply per-connection PRAGMAs"""
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+
+def _update_sql(table: str, columns: Tuple[str, ...]) -> str:
+    """Build an UPDATE statement setting the given columns and updated_at"""
+    set_clauses = ", ".join(f"{column} = ?" for column in columns)
+    return f"UPDATE {table} SET {set_clauses}, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+
+def _prepared_updates(table: str, shapes) -> Dict[frozenset, Tuple[Tuple[str, ...], str]]:
+    """Map each column set to its parameter order and fixed SQL"""
+    return {frozenset(columns): (columns, _update_sql(table, columns)) for columns in shapes}
+
+def _lookup_update(table: str, statements: Dict[frozenset, Tuple[Tuple[str, ...], str]],
+                   fields: Dict[str, Any]) -> Tuple[Tuple[str, ...], str]:
+    """Return the parameter order and SQL for a column set
+    
+    Column sets without a prepared statement are built once and cached, so
+    the SQL string is not rebuilt on every flush.
+    """
+    key = frozenset(fields)
+    statement = statements.get(key)
+    if statement is None:
+        columns = tuple(fields)
+        statement = statements[key] = (columns, _update_sql(table, columns))
+    return statement
+
+def _check_columns(table: str, fields: Dict[str, Any], allowed: frozenset):
+    """Reject column names that are not whitelisted for updates"""
+    unknown = set(fields) - allowed
+    if unknown:
+        raise ValueError(f"Cannot update {table} columns: {', '.join(sorted(unknown))}")
+
+# Fixed statements for the update shapes issued by the download manager, so
+# SQLite can reuse the compiled statement instead of re-parsing per call
+_UPDATE_DOWNLOAD_SQL = _prepared_updates("downloads", (
+    ('status',),
+    ('channel_id',),
+    ('total_files', 'total_size', 'completed_files', 'failed_files',
+     'skipped_files', 'downloaded_size', 'progress'),
+    ('status', 'completed_at'),
+    ('status', 'completed_at', 'completed_files', 'failed_files',
+     'downloaded_size', 'progress'),
+    ('status', 'error_message'),
+))
+_UPDATE_FILE_SQL = _prepared_updates("files", (
+    ('progress', 'bytes_downloaded'),
+    ('status',),
+    ('status', 'error_message'),
+    ('status', 'progress', 'bytes_downloaded', 'download_path'),
+    ('status', 'progress', 'bytes_downloaded', 'error_message'),
+))
+
+# Relative counter update; the right-hand side sees the old row values, so
+# progress adds the deltas itself
+_BUMP_DOWNLOAD_SQL = """
+    UPDATE downloads SET
+        completed_files = completed_files + ?,
+        failed_files = failed_files + ?,
+        skipped_files = skipped_files + ?,
+        downloaded_size = downloaded_size + ?,
+        progress = CASE WHEN total_files > 0
+            THEN (completed_files + ? + failed_files + ? + skipped_files + ?) * 100.0 / total_files
+            ELSE 0 END,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+    RETURNING completed_files, failed_files, skipped_files, downloaded_size, progress
+"""
+
 async def init_database():
     """Initialize the SQLite database with required tables"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f"SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))}+ is required "
+            f"(found {sqlite3.sqlite_version})"
+        )
+    
     async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute("PRAGMA journal_mode=WAL")
+        await _apply_pragmas(db)
+        
         # Downloads table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS downloads (
@@ -55,8 +179,7 @@ async def init_database():
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 error_message TEXT,
-                FOREIGN KEY (download_id) REFERENCES downloads (id),
-                UNIQUE(file_hash) ON CONFLICT IGNORE
+                FOREIGN KEY (download_id) REFERENCES downloads (id)
             )
         """)
         
@@ -73,9 +196,18 @@ async def init_database():
         """)
         
         # Create indexes for performance
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_download_id ON files(download_id)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_hash ON files(file_hash)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_download_created ON files(download_id, created_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_hash_status ON files(file_hash, status)")
+        await db.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_files_hash_unique
+            ON files(file_hash) WHERE file_hash IS NOT NULL
+        """)
         await db.execute("CREATE INDEX IF NOT EXISTS idx_downloads_status ON downloads(status)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_downloads_created ON downloads(created_at DESC)")
+        
+        # Superseded by the composite indexes above
+        await db.execute("DROP INDEX IF EXISTS idx_files_download_id")
+        await db.execute("DROP INDEX IF EXISTS idx_files_hash")
         
         await db.commit()
         logger.info("Database initialized successfully")
@@ -83,18 +215,100 @@ async def init_database():
 class DatabaseManager:
     """Manages all database operations"""
     
+    # Columns that update_download/update_file may set
+    _ALLOWED_DOWNLOAD_COLS = frozenset({
+        'channel_id', 'status', 'total_files', 'completed_files', 'failed_files',
+        'skipped_files', 'total_size', 'downloaded_size', 'progress', 'file_types',
+        'max_files', 'completed_at', 'error_message'
+    })
+    _ALLOWED_FILE_COLS = frozenset({
+        'status', 'progress', 'bytes_downloaded', 'download_path', 'file_hash',
+        'error_message'
+    })
+    
     def __init__(self):
         self.db_path = DATABASE_PATH
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._read_pool: asyncio.Queue = asyncio.Queue(maxsize=READ_POOL_SIZE)
+        
+        # Coalesced updates keyed by row id, written by the flush loop
+        self._pending_downloads: Dict[int, Dict[str, Any]] = {}
+        self._pending_files: Dict[int, Dict[str, Any]] = {}
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._analyze_task: Optional[asyncio.Task] = None
+        self._rows_since_analyze = 0
+    
+    async def connect(self):
+        """Open the writer connection and the read-only connection pool"""
+        if self._writer is not None:
+            return
+        
+        # Autocommit: single statements need no COMMIT round trip, and
+        # batches open explicit transactions under _write_lock
+        self._writer = await aiosqlite.connect(self.db_path, isolation_level=None)
+        await _apply_pragmas(self._writer)
+        
+        for _ in range(READ_POOL_SIZE):
+            reader = await aiosqlite.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            await _apply_pragmas(reader)
+            self._readers.append(reader)
+            self._read_pool.put_nowait(reader)
+        
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Database connections opened (1 writer, {READ_POOL_SIZE} readers)")
+    
+    async def close(self):
+        """Close the writer and all pooled readers"""
+        if self._writer is None:
+            return
+        
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._analyze_task:
+            await self._analyze_task
+            self._analyze_task = None
+        await self._writer.execute("PRAGMA optimize")
+        
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._read_pool = asyncio.Queue(maxsize=READ_POOL_SIZE)
+        
+        await self._writer.close()
+        self._writer = None
+        logger.info("Database connections closed")
+    
+    @asynccontextmanager
+    async def _reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only connection from the pool
+        
+        SELECTs run without an explicit transaction, so readers never commit.
+        """
+        db = await self._read_pool.get()
+        try:
+            yield db
+        finally:
+            self._read_pool.put_nowait(db)
     
     async def create_download(self, download_info: DownloadInfo) -> int:
         """Create a new download record"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write_lock:
+            db = self._writer
             file_types_json = json.dumps(download_info.file_types) if download_info.file_types else None
             
             cursor = await db.execute("""
                 INSERT INTO downloads 
                 (channel_name, channel_id, status, file_types, max_files)
                 VALUES (?, ?, ?, ?, ?)
+                RETURNING id
             """, (
                 download_info.channel_name,
                 download_info.channel_id,
@@ -103,71 +317,148 @@ class DatabaseManager:
                 download_info.max_files
             ))
             
-            download_id = cursor.lastrowid
-            await db.commit()
+            (download_id,) = await cursor.fetchone()
             logger.info(f"Created download record with ID: {download_id}")
             return download_id
     
     async def update_download(self, download_id: int, **kwargs) -> bool:
-        """Update download record"""
+        """Queue an update to a download record
+        
+        Updates are merged per download and written by the flush loop;
+        status changes are flushed immediately.
+        """
         if not kwargs:
             return False
+        _check_columns("downloads", kwargs, self._ALLOWED_DOWNLOAD_COLS)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # Build dynamic update query
-            set_clauses = []
-            values = []
-            
-            for key, value in kwargs.items():
-                if key == 'file_types' and isinstance(value, list):
-                    value = json.dumps(value)
-                set_clauses.append(f"{key} = ?")
-                values.append(value)
-            
-            values.append(datetime.now().isoformat())
-            values.append(download_id)
-            
-            query = f"""
-                UPDATE downloads 
-                SET {', '.join(set_clauses)}, updated_at = ?
-                WHERE id = ?
-            """
-            
-            await db.execute(query, values)
-            await db.commit()
-            return True
+        self._pending_downloads.setdefault(download_id, {}).update(kwargs)
+        if 'status' in kwargs:
+            await self.flush()
+        return True
+    
+    async def bump_download_counters(
+        self,
+        download_id: int,
+        *,
+        completed_delta: int = 0,
+        failed_delta: int = 0,
+        skipped_delta: int = 0,
+        bytes_delta: int = 0
+    ) -> Optional[Tuple[int, int, int, int, float]]:
+        """Atomically add to a download's counters and recompute its progress
+        
+        Returns the new (completed_files, failed_files, skipped_files,
+        downloaded_size, progress), or None if the download does not exist.
+        """
+        async with self._write_lock:
+            db = self._writer
+            # Queued fields such as total_files must land before progress is derived
+            pending = self._pending_downloads.pop(download_id, None)
+            if pending:
+                await db.execute("BEGIN")
+            try:
+                if pending:
+                    await self._write_download_update(db, download_id, pending)
+                cursor = await db.execute(_BUMP_DOWNLOAD_SQL, (
+                    completed_delta, failed_delta, skipped_delta, bytes_delta,
+                    completed_delta, failed_delta, skipped_delta,
+                    download_id
+                ))
+                row = await cursor.fetchone()
+                if pending:
+                    await db.commit()
+            except BaseException:
+                if pending:
+                    await db.rollback()
+                raise
+            return row
+    
+    async def _write_download_update(self, db: aiosqlite.Connection, download_id: int, fields: Dict[str, Any]):
+        """Execute the UPDATE for one download record"""
+        columns, query = _lookup_update("downloads", _UPDATE_DOWNLOAD_SQL, fields)
+        
+        values = [
+            json.dumps(fields[column]) if column == 'file_types' and isinstance(fields[column], list)
+            else fields[column]
+            for column in columns
+        ]
+        values.append(download_id)
+        
+        await db.execute(query, values)
     
     async def get_download(self, download_id: int) -> Optional[DownloadInfo]:
         """Get download by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM downloads WHERE id = ?", (download_id,))
+        async with self._reader() as db:
+            cursor = await db.execute(f"SELECT {_DOWNLOAD_COLS} FROM downloads WHERE id = ?", (download_id,))
             row = await cursor.fetchone()
             
             if row:
                 return self._row_to_download_info(row)
             return None
     
-    async def get_all_downloads(self, limit: Optional[int] = None) -> List[DownloadInfo]:
-        """Get all downloads"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            query = "SELECT * FROM downloads ORDER BY created_at DESC"
-            if limit:
-                query += f" LIMIT {limit}"
-            
-            cursor = await db.execute(query)
+    async def get_downloads_by_status(self, statuses: List[str]) -> List[DownloadInfo]:
+        """Get downloads whose status is one of the given values, newest first"""
+        if not statuses:
+            return []
+        
+        async with self._reader() as db:
+            placeholders = ", ".join("?" * len(statuses))
+            cursor = await db.execute(f"""
+                SELECT {_DOWNLOAD_COLS} FROM downloads
+                WHERE status IN ({placeholders}) ORDER BY created_at DESC
+            """, statuses)
+            return [self._row_to_download_info(row) for row in await cursor.fetchall()]
+    
+    async def get_download_progress(self, download_id: int) -> Optional[Tuple[str, float, int, int]]:
+        """Get (status, progress, completed_files, total_files) for a download"""
+        async with self._reader() as db:
+            cursor = await db.execute("""
+                SELECT status, progress, completed_files, total_files
+                FROM downloads WHERE id = ?
+            """, (download_id,))
+            row = await cursor.fetchone()
+            return tuple(row) if row else None
+    
+    async def get_all_downloads(
+        self,
+        limit: Optional[int] = 50,
+        offset: int = 0,
+        columns: Optional[Tuple[str, ...]] = None
+    ) -> List[Any]:
+        """Get a page of downloads, newest first.
+        
+        With ``columns`` the raw row tuples are returned in that column order
+        and no DownloadInfo models are built.
+        """
+        if columns:
+            unknown = set(columns) - _DOWNLOAD_COLUMN_NAMES
+            if unknown:
+                raise ValueError(f"Unknown downloads columns: {', '.join(sorted(unknown))}")
+            select = ", ".join(columns)
+        else:
+            select = _DOWNLOAD_COLS
+        
+        async with self._reader() as db:
+            # LIMIT -1 means no limit, so one statement serves every call
+            cursor = await db.execute(
+                f"SELECT {select} FROM downloads ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit or -1, offset)
+            )
             rows = await cursor.fetchall()
             
+            if columns:
+                return rows
             return [self._row_to_download_info(row) for row in rows]
     
     async def create_file(self, file_info: FileInfo) -> int:
         """Create a new file record"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write_lock:
+            db = self._writer
             cursor = await db.execute("""
                 INSERT INTO files 
                 (download_id, message_id, filename, file_type, file_size, file_hash, status)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
             """, (
                 file_info.download_id,
                 file_info.message_id,
@@ -178,133 +469,299 @@ class DatabaseManager:
                 file_info.status.value
             ))
             
-            file_id = cursor.lastrowid
-            await db.commit()
+            (file_id,) = await cursor.fetchone()
             return file_id
     
+    async def create_files_bulk(self, file_infos: List[FileInfo]) -> List[Optional[int]]:
+        """Create many file records in one transaction
+        
+        A file whose hash is already stored is taken over by this download,
+        starting again as pending, unless it was completed or another
+        download that is still running owns it. Returns the IDs in input
+        order: the new or taken-over row, or None for a skipped file.
+        """
+        if not file_infos:
+            return []
+        
+        async with self._write_lock:
+            db = self._writer
+            ids: Dict[Tuple[int, int], int] = {}
+            
+            await db.execute("BEGIN")
+            try:
+                # The unique file_hash index resolves duplicates in the INSERT itself
+                for start in range(0, len(file_infos), BULK_INSERT_ROWS):
+                    chunk = file_infos[start:start + BULK_INSERT_ROWS]
+                    params = []
+                    for file_info in chunk:
+                        params += (
+                            file_info.download_id,
+                            file_info.message_id,
+                            file_info.filename,
+                            file_info.file_type,
+                            file_info.file_size,
+                            file_info.file_hash,
+                            file_info.status.value
+                        )
+                    cursor = await db.execute(f"""
+                        INSERT INTO files 
+                        (download_id, message_id, filename, file_type, file_size, file_hash, status)
+                        VALUES {", ".join(["(?, ?, ?, ?, ?, ?, ?)"] * len(chunk))}
+                        ON CONFLICT(file_hash) WHERE file_hash IS NOT NULL DO UPDATE SET
+                            download_id = excluded.download_id,
+                            status = 'pending',
+                            progress = 0,
+                            bytes_downloaded = 0,
+                            error_message = NULL
+                        WHERE files.status <> 'completed' AND (
+                            files.download_id = excluded.download_id
+                            OR COALESCE((
+                                SELECT status FROM downloads WHERE id = files.download_id
+                            ), '') NOT IN ('pending', 'active', 'paused')
+                        )
+                        RETURNING id, download_id, message_id
+                    """, params)
+                    for file_id, download_id, message_id in await cursor.fetchall():
+                        ids[(download_id, message_id)] = file_id
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+            
+            # Refresh planner statistics once enough new rows have landed
+            self._rows_since_analyze += len(ids)
+            if self._rows_since_analyze >= ANALYZE_THRESHOLD and not self._analyze_task:
+                self._rows_since_analyze = 0
+                self._analyze_task = asyncio.create_task(self._analyze_files())
+            
+            return [ids.get((file_info.download_id, file_info.message_id)) for file_info in file_infos]
+    
+    async def _analyze_files(self):
+        """Run ANALYZE on the files table in the background"""
+        try:
+            async with self._write_lock:
+                await self._writer.execute("ANALYZE files")
+        except Exception as e:
+            logger.error(f"Error analyzing files table: {e}")
+        finally:
+            self._analyze_task = None
+    
     async def update_file(self, file_id: int, **kwargs) -> bool:
-        """Update file record"""
+        """Queue an update to a file record
+        
+        Progress ticks for the same file are coalesced so only the latest
+        values are written; status changes are flushed immediately.
+        """
         if not kwargs:
             return False
+        _check_columns("files", kwargs, self._ALLOWED_FILE_COLS)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            set_clauses = []
-            values = []
-            
-            for key, value in kwargs.items():
-                set_clauses.append(f"{key} = ?")
-                values.append(value)
+        self._pending_files.setdefault(file_id, {}).update(kwargs)
+        if 'status' in kwargs:
+            await self.flush()
+        return True
+    
+    async def _write_file_update(self, db: aiosqlite.Connection, file_id: int, fields: Dict[str, Any]):
+        """Execute the UPDATE for one file record"""
+        columns, query = _lookup_update("files", _UPDATE_FILE_SQL, fields)
+        
+        values = [fields[column] for column in columns]
+        values.append(file_id)
+        
+        await db.execute(query, values)
+    
+    async def flush(self):
+        """Write all pending updates in a single transaction"""
+        # Shielded so a cancelled caller cannot abandon a half-written batch
+        # and leave the writer inside an open transaction
+        await asyncio.shield(self._flush_pending())
+    
+    async def _flush_pending(self):
+        """Swap out the pending updates and write them"""
+        async with self._write_lock:
+            if not self._pending_downloads and not self._pending_files:
+                return
             
-            values.append(datetime.now().isoformat())
-            values.append(file_id)
+            downloads, self._pending_downloads = self._pending_downloads, {}
+            files, self._pending_files = self._pending_files, {}
             
-            query = f"""
-                UPDATE files 
-                SET {', '.join(set_clauses)}, updated_at = ?
-                WHERE id = ?
-            """
+            db = self._writer
             
-            await db.execute(query, values)
-            await db.commit()
-            return True
+            # A lone update autocommits; only real batches need BEGIN/COMMIT
+            batched = len(downloads) + len(files) > 1
+            if batched:
+                await db.execute("BEGIN")
+            try:
+                for download_id, fields in downloads.items():
+                    await self._write_download_update(db, download_id, fields)
+                for file_id, fields in files.items():
+                    await self._write_file_update(db, file_id, fields)
+                if batched:
+                    await db.commit()
+            except Exception:
+                if batched:
+                    await db.rollback()
+                raise
+    
+    async def _flush_loop(self):
+        """Periodically flush coalesced updates"""
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing pending updates: {e}")
     
     async def get_files_by_download(self, download_id: int) -> List[FileInfo]:
         """Get all files for a download"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("""
-                SELECT * FROM files WHERE download_id = ? ORDER BY created_at
+        async with self._reader() as db:
+            cursor = await db.execute(f"""
+                SELECT {_FILE_COLS} FROM files WHERE download_id = ? ORDER BY created_at
             """, (download_id,))
             rows = await cursor.fetchall()
             
             return [self._row_to_file_info(row) for row in rows]
     
+    async def get_file_progress_rows(self, download_id: int) -> List[Tuple[int, str, str, float, int, int]]:
+        """Get (id, filename, status, progress, bytes_downloaded, file_size) for each file"""
+        async with self._reader() as db:
+            cursor = await db.execute("""
+                SELECT id, filename, status, progress, bytes_downloaded, file_size
+                FROM files WHERE download_id = ? ORDER BY created_at
+            """, (download_id,))
+            return [tuple(row) for row in await cursor.fetchall()]
+    
+    async def get_hashes_for_channel(self, channel_id: int) -> Dict[int, str]:
+        """Get {message_id: file_hash} for every file already scanned from a channel"""
+        async with self._reader() as db:
+            cursor = await db.execute("""
+                SELECT files.message_id, files.file_hash
+                FROM downloads JOIN files ON files.download_id = downloads.id
+                WHERE downloads.channel_id = ? AND files.file_hash IS NOT NULL
+            """, (channel_id,))
+            return dict(await cursor.fetchall())
+    
     async def check_file_exists(self, file_hash: str) -> bool:
         """Check if file already exists by hash"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._reader() as db:
             cursor = await db.execute("""
                 SELECT id FROM files WHERE file_hash = ? AND status = 'completed'
             """, (file_hash,))
             row = await cursor.fetchone()
             return row is not None
     
+    async def check_files_exist(self, file_hashes: List[str]) -> set:
+        """Return the subset of hashes that belong to completed files"""
+        hashes = [file_hash for file_hash in file_hashes if file_hash]
+        if not hashes:
+            return set()
+        
+        async with self._reader() as db:
+            placeholders = ", ".join("?" * len(hashes))
+            cursor = await db.execute(f"""
+                SELECT file_hash FROM files
+                WHERE file_hash IN ({placeholders}) AND status = 'completed'
+            """, hashes)
+            return {file_hash for (file_hash,) in await cursor.fetchall()}
+    
     async def save_session(self, session: TelegramSession) -> int:
         """Save or update Telegram session"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write_lock:
+            db = self._writer
             cursor = await db.execute("""
                 INSERT OR REPLACE INTO sessions 
                 (phone_number, session_data, is_active, last_used)
-                VALUES (?, ?, ?, ?)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                RETURNING id
             """, (
                 session.phone_number,
                 session.session_data,
-                session.is_active,
-                datetime.now().isoformat()
+                session.is_active
             ))
             
-            session_id = cursor.lastrowid
-            await db.commit()
+            (session_id,) = await cursor.fetchone()
             return session_id
     
     async def get_session(self, phone_number: str) -> Optional[TelegramSession]:
         """Get Telegram session by phone number"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._reader() as db:
             cursor = await db.execute("""
-                SELECT * FROM sessions WHERE phone_number = ? AND is_active = TRUE
+                SELECT id, phone_number, session_data, is_active, created_at, last_used
+                FROM sessions WHERE phone_number = ? AND is_active = TRUE
             """, (phone_number,))
             row = await cursor.fetchone()
             
             if row:
                 return TelegramSession(
-                    id=row['id'],
-                    phone_number=row['phone_number'],
-                    session_data=row['session_data'],
-                    is_active=row['is_active'],
-                    created_at=row['created_at'],
-                    last_used=row['last_used']
+                    id=row[0],
+                    phone_number=row[1],
+                    session_data=row[2],
+                    is_active=row[3],
+                    created_at=row[4],
+                    last_used=row[5]
                 )
             return None
     
+    async def get_active_sessions(self) -> List[TelegramSession]:
+        """Get all active Telegram sessions"""
+        async with self._reader() as db:
+            cursor = await db.execute("""
+                SELECT id, phone_number, session_data, is_active, created_at, last_used
+                FROM sessions WHERE is_active = TRUE
+            """)
+            rows = await cursor.fetchall()
+            
+            return [
+                TelegramSession(
+                    id=row[0],
+                    phone_number=row[1],
+                    session_data=row[2],
+                    is_active=row[3],
+                    created_at=row[4],
+                    last_used=row[5]
+                )
+                for row in rows
+            ]
+    
     def _row_to_download_info(self, row) -> DownloadInfo:
-        """Convert database row to DownloadInfo"""
-        file_types = json.loads(row['file_types']) if row['file_types'] else None
+        """Convert a _DOWNLOAD_COLS row to DownloadInfo"""
+        file_types = json.loads(row[11]) if row[11] else None
         
         return DownloadInfo(
-            id=row['id'],
-            channel_name=row['channel_name'],
-            channel_id=row['channel_id'],
-            status=DownloadStatus(row['status']),
-            total_files=row['total_files'],
-            completed_files=row['completed_files'],
-            failed_files=row['failed_files'],
-            skipped_files=row['skipped_files'],
-            total_size=row['total_size'],
-            downloaded_size=row['downloaded_size'],
-            progress=row['progress'],
+            id=row[0],
+            channel_name=row[1],
+            channel_id=row[2],
+            status=_DS_LOOKUP[row[3]],
+            total_files=row[4],
+            completed_files=row[5],
+            failed_files=row[6],
+            skipped_files=row[7],
+            total_size=row[8],
+            downloaded_size=row[9],
+            progress=row[10],
             file_types=file_types,
-            max_files=row['max_files'],
-            created_at=row['created_at'],
-            updated_at=row['updated_at'],
-            completed_at=row['completed_at'],
-            error_message=row['error_message']
+            max_files=row[12],
+            created_at=row[13],
+            updated_at=row[14],
+            completed_at=row[15],
+            error_message=row[16]
         )
     
     def _row_to_file_info(self, row) -> FileInfo:
-        """Convert database row to FileInfo"""
+        """Convert a _FILE_COLS row to FileInfo"""
         return FileInfo(
-            id=row['id'],
-            download_id=row['download_id'],
-            message_id=row['message_id'],
-            filename=row['filename'],
-            file_type=row['file_type'],
-            file_size=row['file_size'],
-            file_hash=row['file_hash'],
-            download_path=row['download_path'],
-            status=FileStatus(row['status']),
-            progress=row['progress'],
-            bytes_downloaded=row['bytes_downloaded'],
-            created_at=row['created_at'],
-            updated_at=row['updated_at'],
-            error_message=row['error_message']
+            id=row[0],
+            download_id=row[1],
+            message_id=row[2],
+            filename=row[3],
+            file_type=row[4],
+            file_size=row[5],
+            file_hash=row[6],
+            download_path=row[7],
+            status=_FS_LOOKUP[row[8]],
+            progress=row[9],
+            bytes_downloaded=row[10],
+            created_at=row[11],
+            updated_at=row[12],
+            error_message=row[13]
         )
\ No newline at end of file
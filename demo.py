@@ -14,80 +14,91 @@ def create_demo_database():
     conn = sqlite3.connect('demo.db')
     cursor = conn.cursor()
     
-    # Create tables
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            channel_name TEXT NOT NULL,
-            channel_id INTEGER,
-            status TEXT NOT NULL DEFAULT 'pending',
-            total_files INTEGER DEFAULT 0,
-            completed_files INTEGER DEFAULT 0,
-            failed_files INTEGER DEFAULT 0,
-            skipped_files INTEGER DEFAULT 0,
-            total_size INTEGER DEFAULT 0,
-            downloaded_size INTEGER DEFAULT 0,
-            progress REAL DEFAULT 0.0,
-            file_types TEXT,
-            max_files INTEGER,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            completed_at DATETIME,
-            error_message TEXT
-        )
-    """)
+    # Match the production database tuning
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
     
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            download_id INTEGER NOT NULL,
-            message_id INTEGER NOT NULL,
-            filename TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER NOT NULL,
-            file_hash TEXT,
-            download_path TEXT,
-            status TEXT NOT NULL DEFAULT 'pending',
-            progress REAL DEFAULT 0.0,
-            bytes_downloaded INTEGER DEFAULT 0,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            error_message TEXT,
-            FOREIGN KEY (download_id) REFERENCES downloads (id)
-        )
-    """)
-    
-    # Insert demo data
-    cursor.execute("""
-        INSERT INTO downloads 
-        (channel_name, channel_id, status, total_files, completed_files, 
-         progress, file_types, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, ("@ebookschannel", 12345, "completed", 5, 5, 100.0, 
-          json.dumps(["pdf", "epub", "mobi"]), datetime.now().isoformat()))
-    
-    download_id = cursor.lastrowid
-    
-    # Sample files
-    files_data = [
-        ("Python Programming.pdf", "pdf", 2048000, "completed", 100.0),
-        ("JavaScript Guide.epub", "epub", 1536000, "completed", 100.0),
-        ("Data Science.mobi", "mobi", 1024000, "completed", 100.0),
-        ("Machine Learning.pdf", "pdf", 3072000, "completed", 100.0),
-        ("Web Development.epub", "epub", 2560000, "completed", 100.0)
-    ]
-    
-    for i, (filename, file_type, size, status, progress) in enumerate(files_data):
+    with conn:
+        # sqlite3 does not open a transaction for DDL on its own, so begin
+        # one explicitly to make the tables and sample rows commit together
+        cursor.execute("BEGIN")
+        
+        # Create tables
         cursor.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_name TEXT NOT NULL,
+                channel_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                total_files INTEGER DEFAULT 0,
+                completed_files INTEGER DEFAULT 0,
+                failed_files INTEGER DEFAULT 0,
+                skipped_files INTEGER DEFAULT 0,
+                total_size INTEGER DEFAULT 0,
+                downloaded_size INTEGER DEFAULT 0,
+                progress REAL DEFAULT 0.0,
+                file_types TEXT,
+                max_files INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME,
+                error_message TEXT
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                download_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                file_hash TEXT,
+                download_path TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                progress REAL DEFAULT 0.0,
+                bytes_downloaded INTEGER DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                error_message TEXT,
+                FOREIGN KEY (download_id) REFERENCES downloads (id)
+            )
+        """)
+        
+        # Insert demo data
+        cursor.execute("""
+            INSERT INTO downloads 
+            (channel_name, channel_id, status, total_files, completed_files, 
+             progress, file_types, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, ("@ebookschannel", 12345, "completed", 5, 5, 100.0, 
+              json.dumps(["pdf", "epub", "mobi"]), datetime.now().isoformat()))
+        
+        download_id = cursor.lastrowid
+        
+        # Sample files
+        files_data = [
+            ("Python Programming.pdf", "pdf", 2048000, "completed", 100.0),
+            ("JavaScript Guide.epub", "epub", 1536000, "completed", 100.0),
+            ("Data Science.mobi", "mobi", 1024000, "completed", 100.0),
+            ("Machine Learning.pdf", "pdf", 3072000, "completed", 100.0),
+            ("Web Development.epub", "epub", 2560000, "completed", 100.0)
+        ]
+        
+        created_at = datetime.now().isoformat()
+        rows = [
+            (download_id, 1000 + i, filename, file_type, size,
+             status, progress, size if status == "completed" else 0, created_at)
+            for i, (filename, file_type, size, status, progress) in enumerate(files_data)
+        ]
+        cursor.executemany("""
             INSERT INTO files 
             (download_id, message_id, filename, file_type, file_size, 
              status, progress, bytes_downloaded, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (download_id, 1000 + i, filename, file_type, size, 
-              status, progress, size if status == "completed" else 0,
-              datetime.now().isoformat()))
+        """, rows)
     
-    conn.commit()
     conn.close()
     print("✅ Demo database created successfully!")
 
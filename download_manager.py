@@ -2,7 +2,10 @@
 Download manager for handling file downloads with pause/resume functionality
 """
 import os
+import time
 import asyncio
+from contextlib import aclosing
+from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
 from pathlib import Path
 from datetime import datetime
@@ -11,13 +14,74 @@ import aiofiles
 
 from models import (
     DownloadInfo, FileInfo, DownloadStatus, FileStatus, 
-    FileType, ProgressUpdate
+    FileType, ProgressEvent
 )
+from config import DOWNLOAD_DIR, DEFAULT_MAX_CONCURRENT_DOWNLOADS
 from database import DatabaseManager
 from telegram_client import TelegramClientManager
 
 logger = logging.getLogger(__name__)
 
+# Number of scanned files inserted per database batch
+SCAN_BATCH_SIZE = 500
+
+# Scanned files waiting for a download slot
+DOWNLOAD_QUEUE_SIZE = 64
+
+# A file's progress is persisted once any of these has passed since the last write
+PROGRESS_WRITE_INTERVAL = 0.25  # seconds
+PROGRESS_WRITE_PERCENT = 1.0
+PROGRESS_WRITE_BYTES = 1024 * 1024
+
+# Download counters are persisted every this many finished files or seconds
+COUNTER_FLUSH_FILES = 10
+COUNTER_FLUSH_INTERVAL = 0.5
+
+# Most queued files a download task takes at once, so their messages are
+# looked up in one request
+DOWNLOAD_LOOKUP_BATCH = 8
+
+# DownloadControl.state bits
+PAUSED = 1
+CANCELLED = 2
+
+@dataclass
+class DownloadControl:
+    """Pause/cancel state for a running download
+    
+    ``state`` packs the PAUSED and CANCELLED bits so hot loops test a single
+    int; ``resume_event`` is set whenever the worker may run, for it to wait on.
+    """
+    phone_number: str
+    state: int = 0
+    resume_event: asyncio.Event = field(default_factory=asyncio.Event)
+    channel_dir: Optional[Path] = None
+    
+    def __post_init__(self):
+        if not self.state & PAUSED:
+            self.resume_event.set()
+    
+    @property
+    def paused(self) -> bool:
+        return bool(self.state & PAUSED)
+    
+    @property
+    def cancelled(self) -> bool:
+        return bool(self.state & CANCELLED)
+    
+    def pause(self):
+        self.state |= PAUSED
+        self.resume_event.clear()
+    
+    def resume(self):
+        self.state &= ~PAUSED
+        self.resume_event.set()
+    
+    def cancel(self):
+        self.state |= CANCELLED
+        # Wake the worker if it is waiting in a pause
+        self.resume_event.set()
+
 class DownloadManager:
     """Manages download operations with pause/resume capabilities"""
     
@@ -25,22 +89,27 @@ class DownloadManager:
         self.db_manager = db_manager
         self.telegram_manager = telegram_manager
         self.active_downloads: Dict[int, asyncio.Task] = {}
-        self.download_controls: Dict[int, Dict[str, Any]] = {}  # Control flags for each download
+        self.download_controls: Dict[int, DownloadControl] = {}  # Control signals for each download
         self.progress_callbacks: List[callable] = []
+        self.max_concurrent = DEFAULT_MAX_CONCURRENT_DOWNLOADS  # Files downloaded in parallel per download
+        self._shutting_down = False  # Set by cleanup so interrupted downloads keep their status
         
         # Set database manager reference in telegram manager
         self.telegram_manager.set_db_manager(db_manager)
         
-        # Download directory
-        self.download_dir = Path("downloads")
-        self.download_dir.mkdir(exist_ok=True)
+        # Download directory, created by ensure_dirs() at startup
+        self.download_dir = DOWNLOAD_DIR
     
     def add_progress_callback(self, callback):
         """Add a progress callback function"""
         self.progress_callbacks.append(callback)
     
-    async def _notify_progress(self, update: ProgressUpdate):
-        """Notify all progress callbacks"""
+    async def _notify_progress(self, update: ProgressEvent):
+        """Notify all progress callbacks
+        
+        Per-chunk events are reused for the whole file, so callbacks must
+        copy what they need instead of keeping the event.
+        """
         for callback in self.progress_callbacks:
             try:
                 await callback(update)
@@ -67,11 +136,7 @@ class DownloadManager:
             download_id = await self.db_manager.create_download(download_info)
             
             # Initialize download control
-            self.download_controls[download_id] = {
-                'paused': False,
-                'cancelled': False,
-                'phone_number': phone_number
-            }
+            self.download_controls[download_id] = DownloadControl(phone_number)
             
             # Start download task
             task = asyncio.create_task(self._download_worker(download_id))
@@ -87,21 +152,21 @@ class DownloadManager:
     async def pause_download(self, download_id: int):
         """Pause an active download"""
         if download_id in self.download_controls:
-            self.download_controls[download_id]['paused'] = True
+            self.download_controls[download_id].pause()
             await self.db_manager.update_download(download_id, status=DownloadStatus.PAUSED.value)
             logger.info(f"Paused download {download_id}")
     
     async def resume_download(self, download_id: int):
         """Resume a paused download"""
         if download_id in self.download_controls:
-            self.download_controls[download_id]['paused'] = False
+            self.download_controls[download_id].resume()
             await self.db_manager.update_download(download_id, status=DownloadStatus.ACTIVE.value)
             logger.info(f"Resumed download {download_id}")
     
     async def cancel_download(self, download_id: int):
         """Cancel an active download"""
         if download_id in self.download_controls:
-            self.download_controls[download_id]['cancelled'] = True
+            self.download_controls[download_id].cancel()
             
             # Cancel the task if it's running
             if download_id in self.active_downloads:
@@ -114,126 +179,252 @@ class DownloadManager:
     
     async def _download_worker(self, download_id: int):
         """Main download worker that processes files"""
+        # Counters of this pass, also written when the worker stops early;
+        # counting is set once the stored counters have been reset
+        completed_files = 0
+        failed_files = 0
+        downloaded_size = 0
+        progress = 0.0
+        counting = False
+        
+        def final_counters() -> Dict[str, Any]:
+            if not counting:
+                return {}
+            return {
+                "completed_files": completed_files,
+                "failed_files": failed_files,
+                "downloaded_size": downloaded_size,
+                "progress": progress
+            }
+        
         try:
             controls = self.download_controls[download_id]
-            phone_number = controls['phone_number']
+            phone_number = controls.phone_number
             
-            # Update status to active
-            await self.db_manager.update_download(download_id, status=DownloadStatus.ACTIVE.value)
+            # Update status to active; a resumed paused download stays paused
+            if not controls.state & PAUSED:
+                await self.db_manager.update_download(download_id, status=DownloadStatus.ACTIVE.value)
             
             # Get download info
             download_info = await self.db_manager.get_download(download_id)
             if not download_info:
                 return
             
+            # Create the download directory once for all of its files
+            controls.channel_dir = self.download_dir / f"channel_{download_id}"
+            controls.channel_dir.mkdir(parents=True, exist_ok=True)
+            
             # Get channel info
             channel_info = await self.telegram_manager.get_channel_info(
                 phone_number, download_info.channel_name
             )
             
+            # Hashes from earlier scans of this channel are reused on rescans
+            known_hashes = None
             if channel_info:
                 await self.db_manager.update_download(download_id, channel_id=channel_info.id)
+                known_hashes = await self.db_manager.get_hashes_for_channel(channel_info.id)
             
-            # Scan for files
-            file_types = download_info.file_types if download_info.file_types else None
-            files_found = []
-            total_size = 0
-            
-            async for file_info in self.telegram_manager.scan_channel_files(
-                phone_number=phone_number,
-                channel_name=download_info.channel_name,
-                file_types=file_types,
-                limit=download_info.max_files
-            ):
-                # Check if cancelled
-                if controls['cancelled']:
-                    break
-                
-                # Check for duplicates
-                if await self.db_manager.check_file_exists(file_info.file_hash):
-                    continue
-                
-                file_info.download_id = download_id
-                file_id = await self.db_manager.create_file(file_info)
-                file_info.id = file_id
-                files_found.append(file_info)
-                total_size += file_info.file_size
-            
-            # Update download statistics
+            # Counters restart for this pass; totals grow as the scan finds files
             await self.db_manager.update_download(
                 download_id,
-                total_files=len(files_found),
-                total_size=total_size
+                total_files=0,
+                total_size=0,
+                completed_files=0,
+                failed_files=0,
+                skipped_files=0,
+                downloaded_size=0,
+                progress=0.0
             )
+            counting = True
             
-            # Download files
-            completed_files = 0
-            failed_files = 0
-            downloaded_size = 0
+            total_files = 0
+            total_size = 0
             
-            for file_info in files_found:
-                # Check control flags
-                if controls['cancelled']:
-                    break
-                
-                # Wait if paused
-                while controls['paused'] and not controls['cancelled']:
-                    await asyncio.sleep(1)
-                
-                if controls['cancelled']:
-                    break
-                
-                # Download file
-                success = await self._download_single_file(
-                    download_id, file_info, phone_number
-                )
+            # Counter deltas not yet written to the database
+            pending_completed = 0
+            pending_failed = 0
+            pending_bytes = 0
+            last_counter_flush = time.monotonic()
+            
+            # Scanned files flow through the queue to the download tasks, so
+            # downloading starts while the channel is still being scanned
+            queue: asyncio.Queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+            
+            async def scan_files():
+                file_types = download_info.file_types if download_info.file_types else None
+                scanned = []
                 
-                if success:
-                    completed_files += 1
-                    downloaded_size += file_info.file_size
-                else:
-                    failed_files += 1
+                async def store_scanned():
+                    nonlocal total_files, total_size
+                    stored = await self._store_scanned_files(scanned)
+                    scanned.clear()
+                    if not stored:
+                        return
+                    
+                    total_files += len(stored)
+                    total_size += sum(file_info.file_size for file_info in stored)
+                    await self.db_manager.update_download(
+                        download_id, total_files=total_files, total_size=total_size
+                    )
+                    for file_info in stored:
+                        await queue.put(file_info)
                 
-                # Update progress
-                progress = (completed_files + failed_files) / len(files_found) * 100
-                await self.db_manager.update_download(
-                    download_id,
-                    completed_files=completed_files,
-                    failed_files=failed_files,
-                    downloaded_size=downloaded_size,
-                    progress=progress
-                )
+                try:
+                    # Closed explicitly so the scan's prefetch stops with it,
+                    # also when this task is cancelled
+                    pages = self.telegram_manager.scan_channel_files(
+                        phone_number=phone_number,
+                        channel_name=download_info.channel_name,
+                        file_types=file_types,
+                        limit=download_info.max_files,
+                        known_hashes=known_hashes
+                    )
+                    async with aclosing(pages):
+                        async for page in pages:
+                            # Check if cancelled
+                            if controls.state & CANCELLED:
+                                break
+                            
+                            for file_info in page:
+                                file_info.download_id = download_id
+                            scanned.extend(page)
+                            
+                            # Insert scanned files in batches, or straight away
+                            # when the downloaders have nothing left to do
+                            if len(scanned) >= SCAN_BATCH_SIZE or queue.empty():
+                                await store_scanned()
+                    
+                    if scanned and not controls.state & CANCELLED:
+                        await store_scanned()
+                finally:
+                    for _ in range(self.max_concurrent):
+                        await queue.put(None)
+            
+            async def download_files():
+                nonlocal completed_files, failed_files, downloaded_size, progress
+                nonlocal pending_completed, pending_failed, pending_bytes, last_counter_flush
                 
-                # Notify progress
-                await self._notify_progress(ProgressUpdate(
-                    download_id=download_id,
-                    file_id=file_info.id,
-                    filename=file_info.filename,
-                    progress=progress,
-                    bytes_downloaded=downloaded_size,
-                    total_bytes=total_size,
-                    status="downloading"
-                ))
+                finished = False
+                while not finished and (file_info := await queue.get()) is not None:
+                    # Take a share of whatever else is queued as well
+                    batch = [file_info]
+                    extra = min(DOWNLOAD_LOOKUP_BATCH - 1, queue.qsize() // self.max_concurrent)
+                    for _ in range(extra):
+                        next_info = queue.get_nowait()
+                        if next_info is None:
+                            finished = True
+                            break
+                        batch.append(next_info)
+                    
+                    # Wait if paused
+                    await controls.resume_event.wait()
+                    
+                    # Keep draining after a cancel so the scanner never blocks
+                    if controls.state & CANCELLED:
+                        continue
+                    
+                    # One lookup for the whole batch; on failure each file
+                    # looks up its own message
+                    try:
+                        messages = await self.telegram_manager.get_messages(
+                            phone_number, download_info.channel_name,
+                            [info.message_id for info in batch]
+                        )
+                    except Exception:
+                        messages = {}
+                    
+                    for file_info in batch:
+                        await controls.resume_event.wait()
+                        if controls.state & CANCELLED:
+                            break
+                        
+                        success = await self._download_single_file(
+                            download_id, file_info, phone_number,
+                            download_info.channel_name, controls.channel_dir,
+                            messages.get(file_info.message_id)
+                        )
+                        
+                        # Update counters and progress
+                        if success:
+                            completed_files += 1
+                            downloaded_size += file_info.file_size
+                            pending_completed += 1
+                            pending_bytes += file_info.file_size
+                        else:
+                            failed_files += 1
+                            pending_failed += 1
+                        progress = (completed_files + failed_files) / total_files * 100
+                        
+                        # Persist them every few files or every half second
+                        now = time.monotonic()
+                        if (
+                            pending_completed + pending_failed >= COUNTER_FLUSH_FILES
+                            or now - last_counter_flush >= COUNTER_FLUSH_INTERVAL
+                        ):
+                            deltas = (pending_completed, pending_failed, pending_bytes)
+                            pending_completed = pending_failed = pending_bytes = 0
+                            last_counter_flush = now
+                            await self.db_manager.bump_download_counters(
+                                download_id,
+                                completed_delta=deltas[0],
+                                failed_delta=deltas[1],
+                                bytes_delta=deltas[2]
+                            )
+                        
+                        # Notify progress
+                        await self._notify_progress(ProgressEvent(
+                            download_id=download_id,
+                            file_id=file_info.id,
+                            filename=file_info.filename,
+                            progress=progress,
+                            bytes_downloaded=downloaded_size,
+                            total_bytes=total_size,
+                            status="downloading"
+                        ))
+            
+            # One scanner feeding up to max_concurrent downloads at a time
+            tasks = [asyncio.create_task(scan_files())]
+            tasks.extend(asyncio.create_task(download_files()) for _ in range(self.max_concurrent))
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
             
-            # Mark as completed or failed
-            final_status = DownloadStatus.COMPLETED if not controls['cancelled'] else DownloadStatus.CANCELLED
+            # Mark as completed or cancelled, writing the final counters in the same update
+            final_status = DownloadStatus.COMPLETED if not controls.state & CANCELLED else DownloadStatus.CANCELLED
             await self.db_manager.update_download(
                 download_id,
                 status=final_status.value,
-                completed_at=datetime.now().isoformat() if final_status == DownloadStatus.COMPLETED else None
+                completed_at=datetime.now().isoformat() if final_status == DownloadStatus.COMPLETED else None,
+                **final_counters()
             )
             
             logger.info(f"Download {download_id} completed: {completed_files} files, {failed_files} failed")
             
         except asyncio.CancelledError:
-            logger.info(f"Download {download_id} was cancelled")
-            await self.db_manager.update_download(download_id, status=DownloadStatus.CANCELLED.value)
+            # Counters still buffered in memory are written in every case
+            if self._shutting_down:
+                # Left active or paused so it is resumed after the restart
+                logger.info(f"Download {download_id} interrupted by shutdown")
+                counters = final_counters()
+                if counters:
+                    await self.db_manager.update_download(download_id, **counters)
+            else:
+                logger.info(f"Download {download_id} was cancelled")
+                await self.db_manager.update_download(
+                    download_id,
+                    status=DownloadStatus.CANCELLED.value,
+                    **final_counters()
+                )
         except Exception as e:
             logger.error(f"Error in download worker {download_id}: {e}")
             await self.db_manager.update_download(
                 download_id,
                 status=DownloadStatus.FAILED.value,
-                error_message=str(e)
+                error_message=str(e),
+                **final_counters()
             )
         finally:
             # Clean up
@@ -242,53 +433,96 @@ class DownloadManager:
             if download_id in self.download_controls:
                 del self.download_controls[download_id]
     
+    async def _store_scanned_files(self, files: List[FileInfo]) -> List[FileInfo]:
+        """Insert a batch of scanned files and return those that were stored"""
+        # Skip files already downloaded, checked for the whole batch at once
+        completed = await self.db_manager.check_files_exist(
+            [file_info.file_hash for file_info in files]
+        )
+        if completed:
+            files = [file_info for file_info in files if file_info.file_hash not in completed]
+        
+        file_ids = await self.db_manager.create_files_bulk(files)
+        
+        stored = []
+        for file_info, file_id in zip(files, file_ids):
+            if file_id is None:
+                continue
+            file_info.id = file_id
+            stored.append(file_info)
+        return stored
+    
     async def _download_single_file(
         self, 
         download_id: int, 
         file_info: FileInfo, 
-        phone_number: str
+        phone_number: str,
+        channel_name: str,
+        channel_dir: Path,
+        message=None
     ) -> bool:
         """Download a single file with progress tracking"""
         try:
             # Update file status
             await self.db_manager.update_file(file_info.id, status=FileStatus.DOWNLOADING.value)
             
-            # Create download path
-            channel_dir = self.download_dir / f"channel_{download_id}"
-            channel_dir.mkdir(exist_ok=True)
+            # Create download path; prefixed with the message ID because files
+            # download in parallel and reposts often share a filename
+            download_path = str(channel_dir / f"{file_info.message_id}_{file_info.filename}")
+            file_info.download_path = download_path
             
-            file_path = channel_dir / file_info.filename
-            file_info.download_path = str(file_path)
+            # Progress callback; every chunk is broadcast, but the database
+            # only sees a write when a threshold is crossed
+            last_write_ts = time.monotonic()
+            last_write_bytes = 0
+            last_write_progress = 0.0
+            
+            # One event per file, updated in place for each chunk
+            event = ProgressEvent(
+                download_id=download_id,
+                file_id=file_info.id,
+                filename=file_info.filename,
+                progress=0.0,
+                bytes_downloaded=0,
+                total_bytes=file_info.file_size,
+                status="downloading",
+                scope="file"
+            )
             
-            # Progress callback
             async def progress_callback(current, total):
+                nonlocal last_write_ts, last_write_bytes, last_write_progress
                 if file_info.id:
                     progress = (current / total) * 100 if total > 0 else 0
-                    await self.db_manager.update_file(
-                        file_info.id,
-                        progress=progress,
-                        bytes_downloaded=current
-                    )
+                    
+                    now = time.monotonic()
+                    if (
+                        now - last_write_ts >= PROGRESS_WRITE_INTERVAL
+                        or progress - last_write_progress >= PROGRESS_WRITE_PERCENT
+                        or current - last_write_bytes >= PROGRESS_WRITE_BYTES
+                    ):
+                        last_write_ts = now
+                        last_write_bytes = current
+                        last_write_progress = progress
+                        await self.db_manager.update_file(
+                            file_info.id,
+                            progress=progress,
+                            bytes_downloaded=current
+                        )
                     
                     # Notify progress
-                    await self._notify_progress(ProgressUpdate(
-                        download_id=download_id,
-                        file_id=file_info.id,
-                        filename=file_info.filename,
-                        progress=progress,
-                        bytes_downloaded=current,
-                        total_bytes=total,
-                        status="downloading"
-                    ))
+                    event.progress = progress
+                    event.bytes_downloaded = current
+                    event.total_bytes = total
+                    await self._notify_progress(event)
             
             # Download the file
-            download_info = await self.db_manager.get_download(download_id)
             success = await self.telegram_manager.download_file(
                 phone_number=phone_number,
-                channel_name=download_info.channel_name,
+                channel_name=channel_name,
                 message_id=file_info.message_id,
-                download_path=str(file_path),
-                progress_callback=progress_callback
+                download_path=download_path,
+                progress_callback=progress_callback,
+                message=message
             )
             
             if success:
@@ -297,7 +531,7 @@ class DownloadManager:
                     status=FileStatus.COMPLETED.value,
                     progress=100.0,
                     bytes_downloaded=file_info.file_size,
-                    download_path=str(file_path)
+                    download_path=download_path
                 )
                 logger.info(f"Downloaded: {file_info.filename}")
                 return True
@@ -324,13 +558,44 @@ class DownloadManager:
         """Get status of a specific download"""
         return await self.db_manager.get_download(download_id)
     
+    async def get_download_progress(self, download_id: int) -> Optional[Dict[str, Any]]:
+        """Get live progress of a download and its files"""
+        progress = await self.db_manager.get_download_progress(download_id)
+        if not progress:
+            return None
+        
+        status, percent, completed_files, total_files = progress
+        files = await self.db_manager.get_file_progress_rows(download_id)
+        
+        return {
+            "status": status,
+            "progress": percent,
+            "completed_files": completed_files,
+            "total_files": total_files,
+            "files": [
+                {
+                    "id": file_id,
+                    "filename": filename,
+                    "status": file_status,
+                    "progress": file_progress,
+                    "bytes_downloaded": bytes_downloaded,
+                    "file_size": file_size
+                }
+                for file_id, filename, file_status, file_progress, bytes_downloaded, file_size in files
+            ]
+        }
+    
     async def get_all_downloads_status(self) -> List[DownloadInfo]:
-        """Get status of all downloads"""
-        return await self.db_manager.get_all_downloads()
+        """Get status of all downloads that have not finished"""
+        return await self.db_manager.get_downloads_by_status([
+            DownloadStatus.ACTIVE.value,
+            DownloadStatus.PAUSED.value,
+            DownloadStatus.PENDING.value
+        ])
     
-    async def get_download_history(self, limit: Optional[int] = 50) -> List[DownloadInfo]:
+    async def get_download_history(self, limit: Optional[int] = 50, offset: int = 0) -> List[DownloadInfo]:
         """Get download history"""
-        return await self.db_manager.get_all_downloads(limit)
+        return await self.db_manager.get_all_downloads(limit, offset)
     
     async def get_download_files(self, download_id: int) -> List[FileInfo]:
         """Get files for a specific download"""
@@ -339,35 +604,38 @@ class DownloadManager:
     async def resume_interrupted_downloads(self):
         """Resume downloads that were interrupted by restart"""
         try:
-            downloads = await self.db_manager.get_all_downloads()
+            downloads = await self.db_manager.get_downloads_by_status(
+                [DownloadStatus.ACTIVE.value, DownloadStatus.PAUSED.value]
+            )
             
             for download in downloads:
-                if download.status in [DownloadStatus.ACTIVE, DownloadStatus.PAUSED]:
-                    logger.info(f"Resuming interrupted download {download.id}")
-                    
-                    # Set up control structure
-                    self.download_controls[download.id] = {
-                        'paused': download.status == DownloadStatus.PAUSED,
-                        'cancelled': False,
-                        'phone_number': "+1234567890"  # Should be stored/configured
-                    }
-                    
-                    # Restart download task
-                    task = asyncio.create_task(self._download_worker(download.id))
-                    self.active_downloads[download.id] = task
+                logger.info(f"Resuming interrupted download {download.id}")
+                
+                # Set up control structure
+                self.download_controls[download.id] = DownloadControl(
+                    "+1234567890",  # Should be stored/configured
+                    state=PAUSED if download.status == DownloadStatus.PAUSED else 0
+                )
+                
+                # Restart download task
+                task = asyncio.create_task(self._download_worker(download.id))
+                self.active_downloads[download.id] = task
                     
         except Exception as e:
             logger.error(f"Error resuming interrupted downloads: {e}")
     
     async def cleanup(self):
         """Clean up resources"""
-        # Cancel all active downloads
-        for download_id in list(self.active_downloads.keys()):
-            await self.cancel_download(download_id)
+        # Stop the running downloads without marking them cancelled, so
+        # resume_interrupted_downloads picks them up on the next start
+        self._shutting_down = True
+        tasks = list(self.active_downloads.values())
+        for task in tasks:
+            task.cancel()
         
         # Wait for all tasks to complete
-        if self.active_downloads:
-            await asyncio.gather(*self.active_downloads.values(), return_exceptions=True)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
         
         # Disconnect Telegram clients
         await self.telegram_manager.disconnect_all()
@@ -3,19 +3,22 @@ Telegram eBook Downloader - Main FastAPI Application
 """
 import os
 import asyncio
+from dataclasses import asdict
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Set
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+import orjson
 import logging
 
+from config import WEBSOCKET_HEARTBEAT_INTERVAL, ensure_dirs
 from database import DatabaseManager, init_database
 from telegram_client import TelegramClientManager
 from download_manager import DownloadManager
-from models import DownloadRequest, DownloadStatus, FileInfo
+from models import DownloadRequest, DownloadStatus, FileInfo, ProgressEvent
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,7 +39,6 @@ app.add_middleware(
 # Create directories
 os.makedirs("static", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
-os.makedirs("downloads", exist_ok=True)
 
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -52,30 +54,59 @@ active_connections: List[WebSocket] = []
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
     
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
     
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                pass
+        if not self.active_connections:
+            return
+        # Serialize once for every client; sent as text since the UI parses JSON strings
+        payload = orjson.dumps(message).decode()
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
+        
+        # Drop clients that could not be reached
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.active_connections.discard(connection)
 
 manager = ConnectionManager()
 
+async def broadcast_progress(update: ProgressEvent):
+    """Forward download progress to connected clients"""
+    # A file's own percentage must not drive the download's progress bar
+    message_type = "file_progress" if update.scope == "file" else "progress_update"
+    await manager.broadcast({"type": message_type, **asdict(update)})
+
+download_manager.add_progress_callback(broadcast_progress)
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Initialize directories and database on startup"""
+    ensure_dirs()
     await init_database()
+    await db_manager.connect()
+    await telegram_manager.load_sessions()
+    # Pick up downloads left active or paused by the last shutdown
+    await download_manager.resume_interrupted_downloads()
     logger.info("Application started successfully")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop downloads and close the database on shutdown"""
+    await download_manager.cleanup()
+    await db_manager.close()
+    logger.info("Application shut down")
+
 @app.get("/")
 async def root(request: Request):
     """Serve the main application page"""
@@ -177,7 +208,7 @@ async def cancel_download(download_id: int):
 
 @app.get("/api/download-status")
 async def get_download_status():
-    """Get status of all downloads"""
+    """Get status of all unfinished downloads; finished ones are in the history"""
     try:
         status = await download_manager.get_all_downloads_status()
         return {"success": True, "data": status}
@@ -199,11 +230,25 @@ async def get_specific_download_status(download_id: int):
         logger.error(f"Status retrieval error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/download-progress/{download_id}")
+async def get_download_progress(download_id: int):
+    """Get live progress of a specific download"""
+    try:
+        progress = await download_manager.get_download_progress(download_id)
+        if not progress:
+            raise HTTPException(status_code=404, detail="Download not found")
+        return {"success": True, "data": progress}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Progress retrieval error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/download-history")
-async def get_download_history(limit: Optional[int] = 50):
+async def get_download_history(limit: Optional[int] = 50, offset: int = 0):
     """Get download history"""
     try:
-        history = await download_manager.get_download_history(limit)
+        history = await download_manager.get_download_history(limit, offset)
         return {"success": True, "data": history}
     except Exception as e:
         logger.error(f"History retrieval error: {e}")
@@ -224,14 +269,23 @@ async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time updates"""
     await manager.connect(websocket)
     try:
+        # Updates only flow to the client; incoming frames are ignored and
+        # the server's ping/pong keeps the connection alive
         while True:
-            # Keep connection alive and listen for client messages
-            data = await websocket.receive_text()
-            # Echo back or handle client messages if needed
-            await websocket.send_text(f"Message received: {data}")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3000)
\ No newline at end of file
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=3000,
+        ws_ping_interval=WEBSOCKET_HEARTBEAT_INTERVAL,
+        ws_ping_timeout=WEBSOCKET_HEARTBEAT_INTERVAL
+    )
\ No newline at end of file
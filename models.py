@@ -3,6 +3,7 @@ Data models for the Telegram eBook Downloader
 """
 from typing import List, Optional
 from pydantic import BaseModel
+from dataclasses import dataclass
 from enum import Enum
 from datetime import datetime
 
@@ -85,6 +86,21 @@ class ProgressUpdate(BaseModel):
     eta: Optional[int] = None
     status: str
 
+@dataclass(slots=True)
+class ProgressEvent:
+    """Unvalidated ProgressUpdate built on the download hot path"""
+    download_id: int
+    file_id: Optional[int]
+    filename: Optional[str]
+    progress: float
+    bytes_downloaded: int
+    total_bytes: int
+    status: str
+    download_speed: Optional[float] = None
+    eta: Optional[int] = None
+    # "download" for the download as a whole, "file" for one file's chunks
+    scope: str = "download"
+
 class AuthenticationRequest(BaseModel):
     phone_number: str
 
@@ -2,14 +2,19 @@
 Telegram client manager using Telethon
 """
 import os
-import hashlib
-from typing import List, Optional, AsyncGenerator
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Dict, AsyncGenerator, Set, Tuple
 from telethon import TelegramClient, events
+from telethon.sessions import StringSession
 from telethon.tl.types import DocumentAttributeFilename, Document
-from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
-from pathlib import Path
+from telethon.errors import (
+    RPCError, SessionPasswordNeededError, PhoneCodeInvalidError, UnauthorizedError, AuthKeyError
+)
 import logging
 
+from config import SESSION_DIR, SUPPORTED_EXTENSIONS, DOWNLOAD_PART_SIZE_KB, file_extension
 from models import FileInfo, ChannelInfo, TelegramSession
 from database import DatabaseManager
 
@@ -19,18 +24,41 @@ logger = logging.getLogger(__name__)
 API_ID = int(os.getenv('TELEGRAM_API_ID', '0'))
 API_HASH = os.getenv('TELEGRAM_API_HASH', '')
 
-# Supported file extensions for eBooks
-SUPPORTED_EXTENSIONS = {
-    '.pdf', '.epub', '.mobi', '.azw3', '.djvu', '.fb2', 
-    '.txt', '.doc', '.docx', '.rtf', '.lit', '.pdb'
-}
+# How long a resolved channel entity is reused before asking Telegram again
+ENTITY_CACHE_TTL = 3600  # seconds
+
+# Messages requested per history page while scanning (Telegram's maximum)
+SCAN_PAGE_SIZE = 100
+
+# Errors meaning the session lost its authorization
+AUTH_ERRORS = (UnauthorizedError, AuthKeyError)
+
+def _discard_result(task: asyncio.Task):
+    """Mark a finished task's exception as retrieved"""
+    if not task.cancelled():
+        task.exception()
+
+class TelegramError(Exception):
+    """A Telegram operation failed for a reason other than an RPC error"""
+
+@dataclass(slots=True)
+class _ClientEntry:
+    """A Telegram client together with the state kept for its phone number"""
+    client: TelegramClient
+    # Whether the session is known to be authorized
+    authorized: bool = False
+    # channel name or id -> (entity, expiry)
+    entities: Dict[Any, Tuple[Any, float]] = field(default_factory=dict)
+    last_used: float = 0.0
 
 class TelegramClientManager:
     """Manages Telegram client connections and operations"""
     
     def __init__(self):
-        self.clients = {}  # phone_number -> TelegramClient
+        self._entries: Dict[str, _ClientEntry] = {}  # phone_number -> client and its state
         self.db_manager = None
+        # Download directories already created by this process
+        self._created_dirs: Set[str] = set()
         
         if not API_ID or not API_HASH:
             logger.warning("Telegram API credentials not found in environment variables")
@@ -39,27 +67,94 @@ class TelegramClientManager:
         """Set database manager reference"""
         self.db_manager = db_manager
     
+    def _get_entry(self, phone_number: str) -> _ClientEntry:
+        """Get or create the client entry for phone number"""
+        entry = self._entries.get(phone_number)
+        if entry is None:
+            # Create session file path
+            session_name = str(SESSION_DIR / phone_number.replace('+', ''))
+            entry = _ClientEntry(TelegramClient(session_name, API_ID, API_HASH))
+            self._entries[phone_number] = entry
+        
+        entry.last_used = time.monotonic()
+        return entry
+    
+    async def load_sessions(self):
+        """Create clients for the sessions stored in the database
+        
+        Stored sessions are string sessions held in memory, so creating
+        their clients opens no session files.
+        """
+        if not self.db_manager or not API_ID or not API_HASH:
+            return
+        
+        loaded = 0
+        for session in await self.db_manager.get_active_sessions():
+            if session.phone_number in self._entries:
+                continue
+            try:
+                string_session = StringSession(session.session_data)
+            except ValueError:
+                # Not a string session (e.g. saved by an older version);
+                # the session file is used instead
+                continue
+            if not string_session.auth_key:
+                continue
+            
+            self._entries[session.phone_number] = _ClientEntry(
+                TelegramClient(string_session, API_ID, API_HASH)
+            )
+            loaded += 1
+        
+        logger.info(f"Loaded {loaded} stored Telegram sessions")
+    
     async def get_client(self, phone_number: str) -> TelegramClient:
         """Get or create Telegram client for phone number"""
-        if phone_number in self.clients:
-            return self.clients[phone_number]
+        return self._get_entry(phone_number).client
+    
+    async def _ensure_authorized(self, entry: _ClientEntry):
+        """Connect the client and check its authorization once per session"""
+        client = entry.client
+        if not client.is_connected():
+            await client.connect()
         
-        # Create session file path
-        session_name = f"sessions/{phone_number.replace('+', '')}"
-        os.makedirs("sessions", exist_ok=True)
+        if entry.authorized:
+            return
         
-        client = TelegramClient(session_name, API_ID, API_HASH)
-        self.clients[phone_number] = client
+        if not await client.is_user_authorized():
+            raise TelegramError("Client not authenticated")
+        entry.authorized = True
+    
+    async def _resolve_entity(self, entry: _ClientEntry, channel_name):
+        """Resolve a channel through the entity cache, hitting Telegram only on a miss"""
+        now = time.monotonic()
+        cached = entry.entities.get(channel_name)
+        if cached and cached[1] > now:
+            return cached[0]
         
-        return client
+        entity = await entry.client.get_entity(channel_name)
+        
+        # Cache under the resolved ID too, so lookups by ID reuse it
+        expiry = now + ENTITY_CACHE_TTL
+        entry.entities[channel_name] = (entity, expiry)
+        entry.entities[entity.id] = (entity, expiry)
+        return entity
+    
+    def _forget_authorization(self, phone_number: str):
+        """Re-check authorization on the next call"""
+        entry = self._entries.get(phone_number)
+        if entry is not None:
+            entry.authorized = False
     
     async def authenticate(self, phone_number: str) -> dict:
         """Start Telegram authentication process"""
         try:
-            client = await self.get_client(phone_number)
+            entry = self._get_entry(phone_number)
+            client = entry.client
             await client.connect()
             
             if await client.is_user_authorized():
+                entry.authorized = True
                 return {
                     "authenticated": True,
                     "message": "Already authenticated"
@@ -75,14 +170,20 @@ class TelegramClientManager:
                 "message": "Verification code sent"
             }
             
+        except RPCError as e:
+            # Telegram's own errors propagate as-is, e.g. so a FloodWaitError
+            # keeps its wait time
+            logger.error(f"Authentication error: {e}")
+            raise
         except Exception as e:
             logger.error(f"Authentication error: {e}")
-            raise Exception(f"Failed to authenticate: {str(e)}")
+            raise TelegramError(f"Failed to authenticate: {e}") from e
     
     async def verify_code(self, phone_number: str, code: str) -> dict:
         """Verify the authentication code"""
         try:
-            client = await self.get_client(phone_number)
+            entry = self._get_entry(phone_number)
+            client = entry.client
             
             if not client.is_connected():
                 await client.connect()
@@ -91,12 +192,15 @@ class TelegramClientManager:
             await client.sign_in(phone=phone_number, code=code)
             
             if await client.is_user_authorized():
+                entry.authorized = True
+                
                 # Save session to database
                 if self.db_manager:
-                    session_data = client.session.save()
+                    # The client keeps an SQLite session file, whose save()
+                    # only commits it; encode the auth key as a string session
                     session = TelegramSession(
                         phone_number=phone_number,
-                        session_data=str(session_data),
+                        session_data=StringSession.save(client.session),
                         is_active=True
                     )
                     await self.db_manager.save_session(session)
@@ -111,27 +215,26 @@ class TelegramClientManager:
                     "message": "Authentication failed"
                 }
                 
-        except PhoneCodeInvalidError:
-            raise Exception("Invalid verification code")
-        except SessionPasswordNeededError:
-            raise Exception("Two-factor authentication is enabled. Please disable it or implement 2FA support")
+        except PhoneCodeInvalidError as e:
+            raise TelegramError("Invalid verification code") from e
+        except SessionPasswordNeededError as e:
+            raise TelegramError("Two-factor authentication is enabled. Please disable it or implement 2FA support") from e
+        except RPCError as e:
+            logger.error(f"Code verification error: {e}")
+            raise
         except Exception as e:
             logger.error(f"Code verification error: {e}")
-            raise Exception(f"Failed to verify code: {str(e)}")
+            raise TelegramError(f"Failed to verify code: {e}") from e
     
     async def get_channel_info(self, phone_number: str, channel_name: str) -> Optional[ChannelInfo]:
         """Get information about a Telegram channel"""
         try:
-            client = await self.get_client(phone_number)
-            
-            if not client.is_connected():
-                await client.connect()
+            entry = self._get_entry(phone_number)
             
-            if not await client.is_user_authorized():
-                raise Exception("Client not authenticated")
+            await self._ensure_authorized(entry)
             
             # Get channel entity
-            channel = await client.get_entity(channel_name)
+            channel = await self._resolve_entity(entry, channel_name)
             
             return ChannelInfo(
                 id=channel.id,
@@ -141,80 +244,147 @@ class TelegramClientManager:
                 about=getattr(channel, 'about', None)
             )
             
+        except RPCError as e:
+            if isinstance(e, AUTH_ERRORS):
+                self._forget_authorization(phone_number)
+            logger.error(f"Error getting channel info: {e}")
+            raise
         except Exception as e:
             logger.error(f"Error getting channel info: {e}")
-            raise Exception(f"Failed to get channel info: {str(e)}")
+            raise TelegramError(f"Failed to get channel info: {e}") from e
     
     async def scan_channel_files(
         self, 
         phone_number: str, 
         channel_name: str, 
         file_types: Optional[List[str]] = None,
-        limit: Optional[int] = None
-    ) -> AsyncGenerator[FileInfo, None]:
-        """Scan channel for eBook files"""
+        limit: Optional[int] = None,
+        known_hashes: Optional[Dict[int, str]] = None
+    ) -> AsyncGenerator[List[FileInfo], None]:
+        """Scan channel for eBook files, yielding the files of each history page as a list
+        
+        ``known_hashes`` maps message IDs to hashes from earlier scans, which
+        are reused instead of being recomputed.
+        """
         try:
-            client = await self.get_client(phone_number)
+            entry = self._get_entry(phone_number)
+            client = entry.client
             
-            if not client.is_connected():
-                await client.connect()
-            
-            if not await client.is_user_authorized():
-                raise Exception("Client not authenticated")
+            await self._ensure_authorized(entry)
             
             # Get channel entity
-            channel = await client.get_entity(channel_name)
+            channel = await self._resolve_entity(entry, channel_name)
             file_count = 0
             
-            # Iterate through messages
-            async for message in client.iter_messages(channel):
-                if limit and file_count >= limit:
-                    break
-                
-                if not message.document:
-                    continue
-                
-                document = message.document
-                if not isinstance(document, Document):
-                    continue
-                
-                # Get filename
-                filename = None
-                for attr in document.attributes:
-                    if isinstance(attr, DocumentAttributeFilename):
-                        filename = attr.file_name
+            # Extensions accepted by this scan, narrowed once by the requested file types
+            allowed_extensions = SUPPORTED_EXTENSIONS
+            if file_types:
+                allowed_extensions = SUPPORTED_EXTENSIONS & {f".{ft.lower()}" for ft in file_types}
+            
+            # Fetch history a page at a time, requesting the next page while
+            # the current one is filtered and consumed
+            next_page = asyncio.create_task(
+                client.get_messages(channel, limit=SCAN_PAGE_SIZE)
+            )
+            try:
+                while True:
+                    messages = await next_page
+                    if not messages:
                         break
+                    
+                    if len(messages) == SCAN_PAGE_SIZE:
+                        next_page = asyncio.create_task(client.get_messages(
+                            channel, limit=SCAN_PAGE_SIZE, offset_id=messages[-1].id
+                        ))
+                    
+                    batch = []
+                    for message in messages:
+                        if limit and file_count >= limit:
+                            break
+                        
+                        if not message.document:
+                            continue
+                        
+                        document = message.document
+                        if not isinstance(document, Document):
+                            continue
+                        
+                        # Get filename; TL types are never subclassed, so an identity
+                        # check on the type is enough
+                        filename = None
+                        for attr in document.attributes:
+                            if type(attr) is DocumentAttributeFilename:
+                                filename = attr.file_name
+                                break
+                        
+                        if not filename:
+                            continue
+                        
+                        # Check if it's a supported and requested file type
+                        file_ext = file_extension(filename)
+                        if file_ext not in allowed_extensions:
+                            continue
+                        
+                        # Dedup key for duplicate detection; messages seen before keep
+                        # their stored key, including older hashed ones
+                        file_hash = known_hashes.get(message.id) if known_hashes else None
+                        if file_hash is None:
+                            file_hash = self.get_file_hash(channel.id, message.id, filename)
+                        
+                        file_info = FileInfo(
+                            download_id=0,  # Will be set later
+                            message_id=message.id,
+                            filename=filename,
+                            file_type=file_ext[1:],
+                            file_size=document.size,
+                            file_hash=file_hash
+                        )
+                        
+                        file_count += 1
+                        batch.append(file_info)
+                    
+                    if batch:
+                        yield batch
+                    
+                    # A short page, or reaching the limit, is the end of the scan
+                    if len(messages) < SCAN_PAGE_SIZE or (limit and file_count >= limit):
+                        break
+            finally:
+                next_page.cancel()
+                # Retrieve the prefetch's outcome so a page that failed after
+                # the scan ended is not reported as never retrieved
+                next_page.add_done_callback(_discard_result)
                 
-                if not filename:
-                    continue
-                
-                # Check if it's a supported file type
-                file_ext = Path(filename).suffix.lower()
-                if file_ext not in SUPPORTED_EXTENSIONS:
-                    continue
-                
-                # Filter by file types if specified
-                if file_types and file_ext.lstrip('.') not in [ft.lower() for ft in file_types]:
-                    continue
-                
-                # Calculate file hash for duplicate detection
-                file_hash = hashlib.md5(f"{channel.id}_{message.id}_{filename}".encode()).hexdigest()
-                
-                file_info = FileInfo(
-                    download_id=0,  # Will be set later
-                    message_id=message.id,
-                    filename=filename,
-                    file_type=file_ext.lstrip('.'),
-                    file_size=document.size,
-                    file_hash=file_hash
-                )
-                
-                file_count += 1
-                yield file_info
-                
+        except RPCError as e:
+            if isinstance(e, AUTH_ERRORS):
+                self._forget_authorization(phone_number)
+            logger.error(f"Error scanning channel: {e}")
+            raise
         except Exception as e:
             logger.error(f"Error scanning channel: {e}")
-            raise Exception(f"Failed to scan channel: {str(e)}")
+            raise TelegramError(f"Failed to scan channel: {e}") from e
+    
+    async def get_messages(self, phone_number: str, channel_name: str, message_ids: List[int]) -> Dict[int, Any]:
+        """Look up several messages of a channel in a single request"""
+        try:
+            entry = self._get_entry(phone_number)
+            
+            await self._ensure_authorized(entry)
+            
+            channel = await self._resolve_entity(entry, channel_name)
+            messages = await entry.client.get_messages(channel, ids=message_ids)
+            
+            # Missing or deleted messages come back as None
+            return {message.id: message for message in messages if message}
+            
+        except RPCError as e:
+            if isinstance(e, AUTH_ERRORS):
+                self._forget_authorization(phone_number)
+            logger.error(f"Error getting messages: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Error getting messages: {e}")
+            raise TelegramError(f"Failed to get messages: {e}") from e
     
     async def download_file(
         self, 
@@ -222,50 +392,100 @@ class TelegramClientManager:
         channel_name: str, 
         message_id: int, 
         download_path: str,
-        progress_callback=None
+        progress_callback=None,
+        message=None
     ) -> bool:
-        """Download a specific file from channel"""
+        """Download a specific file from channel
+        
+        ``message`` may be passed when it was already fetched, e.g. by
+        get_messages, to skip looking it up again.
+        """
         try:
-            client = await self.get_client(phone_number)
+            entry = self._get_entry(phone_number)
+            client = entry.client
             
-            if not client.is_connected():
-                await client.connect()
-            
-            if not await client.is_user_authorized():
-                raise Exception("Client not authenticated")
+            await self._ensure_authorized(entry)
             
             # Get channel and message
-            channel = await client.get_entity(channel_name)
-            message = await client.get_messages(channel, ids=message_id)
+            if message is None:
+                channel = await self._resolve_entity(entry, channel_name)
+                message = await client.get_messages(channel, ids=message_id)
             
             if not message or not message.document:
                 return False
             
-            # Create download directory
-            os.makedirs(os.path.dirname(download_path), exist_ok=True)
+            # Create the download directory the first time it is seen
+            directory = os.path.dirname(download_path)
+            if directory not in self._created_dirs:
+                os.makedirs(directory, exist_ok=True)
+                self._created_dirs.add(directory)
             
-            # Download the file
-            await client.download_media(
-                message.document,
-                file=download_path,
-                progress_callback=progress_callback
-            )
+            with open(download_path, 'wb') as f:
+                # Reserve the whole file up front so it is laid out in one go
+                # rather than extended chunk by chunk
+                file_size = message.document.size
+                if file_size and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, file_size)
+                    except OSError as e:
+                        logger.debug(f"Could not preallocate {download_path}: {e}")
+                
+                try:
+                    # Download the file in the largest parts Telegram allows, so each
+                    # request and each write to disk moves as much data as possible
+                    await client.download_file(
+                        message.document,
+                        file=f,
+                        part_size_kb=DOWNLOAD_PART_SIZE_KB,
+                        file_size=file_size,
+                        progress_callback=progress_callback
+                    )
+                finally:
+                    # Drop any preallocated space past the received data, also when
+                    # the download failed, so a partial file never looks complete
+                    f.truncate()
             
             return True
             
         except Exception as e:
+            if isinstance(e, AUTH_ERRORS):
+                self._forget_authorization(phone_number)
             logger.error(f"Error downloading file: {e}")
             return False
     
     async def disconnect_all(self):
-        """Disconnect all clients"""
-        for client in self.clients.values():
-            if client.is_connected():
-                await client.disconnect()
+        """Disconnect all clients, saving the sessions of authorized ones"""
+        async def close(phone_number: str, entry: _ClientEntry):
+            # Keep the stored session current, e.g. after a DC migration
+            if entry.authorized and self.db_manager:
+                try:
+                    await self.db_manager.save_session(TelegramSession(
+                        phone_number=phone_number,
+                        session_data=StringSession.save(entry.client.session),
+                        is_active=True
+                    ))
+                except Exception as e:
+                    logger.error(f"Error saving session: {e}")
+            
+            if entry.client.is_connected():
+                await entry.client.disconnect()
+        
+        # Clients disconnect in parallel; one failing does not stop the others
+        results = await asyncio.gather(
+            *(close(phone_number, entry) for phone_number, entry in self._entries.items()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error disconnecting client: {result}")
         
-        self.clients.clear()
+        self._entries.clear()
         logger.info("All Telegram clients disconnected")
     
-    def get_file_hash(self, channel_id: int, message_id: int, filename: str) -> str:
-        """Generate consistent hash for file identification"""
-        return hashlib.md5(f"{channel_id}_{message_id}_{filename}".encode()).hexdigest()
\ No newline at end of file
+    def get_file_hash(self, channel_id: int, message_id: int, filename: Optional[str] = None) -> str:
+        """Generate the dedup key identifying a file
+        
+        A message ID is unique within its channel, so the pair identifies the
+        file without hashing; ``filename`` is accepted for compatibility.
+        """
+        return f"{channel_id}:{message_id}"
\ No newline at end of file
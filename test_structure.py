@@ -4,33 +4,62 @@ Test script to validate the application structure and demonstrate functionality
 """
 
 import os
+import re
 import json
+from functools import lru_cache
 from pathlib import Path
 
+REQUIRED_FILES = [
+    "main.py",
+    "models.py", 
+    "database.py",
+    "telegram_client.py",
+    "download_manager.py",
+    "config.py",
+    "requirements.txt",
+    ".env.example",
+    "README.md",
+    "templates/index.html",
+    "static/app.js"
+]
+
+def read_files(paths):
+    """Read each file once, so every check works on the same contents; missing files are left out"""
+    contents = {}
+    for file_path in paths:
+        try:
+            contents[file_path] = Path(file_path).read_bytes()
+        except OSError:
+            pass
+    return contents
+
+@lru_cache(maxsize=None)
+def file_contents():
+    """Contents of the required files, read on first use and shared by all tests"""
+    return read_files(REQUIRED_FILES)
+
+def find_patterns(patterns, text):
+    """Return the patterns that occur in text, found in a single pass"""
+    # A lookahead matches at every position, and longest-first alternation
+    # reports the longest pattern starting there; shorter patterns starting
+    # at the same position are its prefixes
+    ordered = sorted(patterns, key=len, reverse=True)
+    matcher = re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+    matched = {m.group(1) for m in matcher.finditer(text)}
+    return {p for p in patterns if any(q.startswith(p) for q in matched)}
+
 def test_file_structure():
     """Test that all required files are present"""
+    contents = file_contents()
+    
     print("🧪 Testing Application File Structure")
     print("=" * 50)
     
-    required_files = [
-        "main.py",
-        "models.py", 
-        "database.py",
-        "telegram_client.py",
-        "download_manager.py",
-        "config.py",
-        "requirements.txt",
-        ".env.example",
-        "README.md",
-        "templates/index.html",
-        "static/app.js"
-    ]
-    
     all_present = True
     
-    for file_path in required_files:
-        if Path(file_path).exists():
-            size = Path(file_path).stat().st_size
+    for file_path in REQUIRED_FILES:
+        if file_path in contents:
+            size = len(contents[file_path])
             print(f"✅ {file_path:<25} ({size:,} bytes)")
         else:
             print(f"❌ {file_path:<25} (MISSING)")
@@ -41,20 +70,22 @@ def test_file_structure():
 
 def test_configuration():
     """Test configuration setup"""
+    contents = file_contents()
+    
     print("\n🔧 Testing Configuration")
     print("=" * 50)
     
     # Check .env.example
-    if Path(".env.example").exists():
-        with open(".env.example", "r") as f:
-            env_content = f.read()
-            required_vars = ["TELEGRAM_API_ID", "TELEGRAM_API_HASH", "HOST", "PORT"]
-            
-            for var in required_vars:
-                if var in env_content:
-                    print(f"✅ {var} defined in .env.example")
-                else:
-                    print(f"❌ {var} missing in .env.example")
+    if ".env.example" in contents:
+        env_content = contents[".env.example"].decode()
+        required_vars = ["TELEGRAM_API_ID", "TELEGRAM_API_HASH", "HOST", "PORT"]
+        
+        found = find_patterns(required_vars, env_content)
+        for var in required_vars:
+            if var in found:
+                print(f"✅ {var} defined in .env.example")
+            else:
+                print(f"❌ {var} missing in .env.example")
     
     # Check directories
     required_dirs = ["downloads", "sessions", "templates", "static"]
@@ -66,13 +97,14 @@ def test_configuration():
 
 def test_models_structure():
     """Test that model files contain expected classes"""
+    contents = file_contents()
+    
     print("\n📊 Testing Models and Data Structures")
     print("=" * 50)
     
     # Read models.py and check for key classes
     try:
-        with open("models.py", "r") as f:
-            models_content = f.read()
+        models_content = contents["models.py"].decode()
             
         expected_classes = [
             "DownloadRequest",
@@ -82,8 +114,9 @@ def test_models_structure():
             "TelegramSession"
         ]
         
+        found = find_patterns([f"class {name}" for name in expected_classes], models_content)
         for class_name in expected_classes:
-            if f"class {class_name}" in models_content:
+            if f"class {class_name}" in found:
                 print(f"✅ Model {class_name} defined")
             else:
                 print(f"❌ Model {class_name} missing")
@@ -93,12 +126,13 @@ def test_models_structure():
 
 def test_api_endpoints():
     """Test API endpoint definitions"""
+    contents = file_contents()
+    
     print("\n🔌 Testing API Endpoints")
     print("=" * 50)
     
     try:
-        with open("main.py", "r") as f:
-            main_content = f.read()
+        main_content = contents["main.py"].decode()
             
         expected_endpoints = [
             "/api/authenticate",
@@ -111,8 +145,9 @@ def test_api_endpoints():
             "/api/download-history"
         ]
         
+        found = find_patterns(expected_endpoints, main_content)
         for endpoint in expected_endpoints:
-            if endpoint in main_content:
+            if endpoint in found:
                 print(f"✅ Endpoint {endpoint} defined")
             else:
                 print(f"❌ Endpoint {endpoint} missing")
@@ -122,13 +157,14 @@ def test_api_endpoints():
 
 def test_frontend_components():
     """Test frontend file structure"""
+    contents = file_contents()
+    
     print("\n🌐 Testing Frontend Components")
     print("=" * 50)
     
     # Test HTML template
     try:
-        with open("templates/index.html", "r") as f:
-            html_content = f.read()
+        html_content = contents["templates/index.html"].decode()
             
         required_elements = [
             "authSection",
@@ -139,8 +175,9 @@ def test_frontend_components():
             "downloadHistory"
         ]
         
+        found = find_patterns(required_elements, html_content)
         for element in required_elements:
-            if element in html_content:
+            if element in found:
                 print(f"✅ HTML element {element} found")
             else:
                 print(f"❌ HTML element {element} missing")
@@ -150,8 +187,7 @@ def test_frontend_components():
     
     # Test JavaScript
     try:
-        with open("static/app.js", "r") as f:
-            js_content = f.read()
+        js_content = contents["static/app.js"].decode()
             
         required_functions = [
             "sendCode",
@@ -162,8 +198,9 @@ def test_frontend_components():
             "cancelDownload"
         ]
         
+        found = find_patterns(required_functions, js_content)
         for func in required_functions:
-            if func in js_content:
+            if func in found:
                 print(f"✅ JavaScript function {func} found")
             else:
                 print(f"❌ JavaScript function {func} missing")